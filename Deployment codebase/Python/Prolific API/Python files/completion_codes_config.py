@@ -5,61 +5,135 @@ This file contains the mapping between CSV flags and Prolific completion codes.
 Update the COMPLETION_CODES dictionary when codes change.
 """
 
+import functools
+
 # === COMPLETION CODES CONFIGURATION === #
 COMPLETION_CODES = {
     "APPROVED": "C1G9PC0D",          # Default - auto-approve
-    "SCREENED_OUT": "C1NFUEQ1",      # Screened out participants  
+    "SCREENED_OUT": "C1NFUEQ1",      # Screened out participants
     "FAILED_ATTENTION": "C1M8R1Y4",  # Failed attention checks
     "NO_CONSENT": "COISODYI"         # Did not give consent
 }
 
+# Reverse lookups built once at import time so the per-submission helpers
+# below are O(1) dict/set lookups instead of linear scans over COMPLETION_CODES.
+_CODE_TO_NAME = {code: name for name, code in COMPLETION_CODES.items()}
+_CODE_SET = frozenset(COMPLETION_CODES.values())
+
+_ACTION_BY_CODE = {
+    COMPLETION_CODES["APPROVED"]: "SKIP",            # Auto-approves, no action needed
+    COMPLETION_CODES["SCREENED_OUT"]: "SCREEN_OUT",  # Use bulk screen out endpoint
+    COMPLETION_CODES["FAILED_ATTENTION"]: "REJECT",  # Use reject action
+    COMPLETION_CODES["NO_CONSENT"]: "REJECT"         # Use reject action
+}
+
+_EXPECTED_OUTCOMES = {
+    'APPROVED': 'AUTO_APPROVE',
+    'SCREENED_OUT': 'SCREENED_OUT_WITH_PAYMENT',
+    'FAILED_ATTENTION': 'REJECT',
+    'NO_CONSENT': 'REJECT'
+}
+
+_DESCRIPTIONS = {
+    'APPROVED': 'Participant completed successfully and should be auto-approved',
+    'SCREENED_OUT': 'Participant was screened out and should receive screening payment',
+    'FAILED_ATTENTION': 'Participant failed attention checks and should be rejected',
+    'NO_CONSENT': 'Participant did not provide consent and should be rejected'
+}
+
+# Flag columns inspected by determine_completion_code, in priority order.
+_SCREENING_FLAGS = (
+    'did_not_understand_tasks',
+    'occupation_not_confirmed',
+    'insufficient_work_experience'
+)
+
+# Reason strings for the screening flags, interned once at import so every
+# screened-out row returns the same cached string object.
+_SCREENING_REASONS = {
+    flag: f"Participant was screened out due to: {flag.replace('_', ' ')}"
+    for flag in _SCREENING_FLAGS
+}
+
+_RELEVANT_FLAGS = (
+    'no_consent',
+    'failed_two_plus_attention_checks',
+) + _SCREENING_FLAGS + (
+    'screened_out',
+    'incomplete_survey_other_reasons',
+    'completed_survey',
+)
+
 # === CSV FLAG TO COMPLETION CODE MAPPING === #
-def determine_completion_code(csv_row):
+def determine_completion_code(csv_row: dict) -> tuple[str | None, str]:
     """
     Determines the appropriate completion code based on CSV flags.
-    
+
     Args:
         csv_row (dict): A row from the CSV with participant flags
-        
+
     Returns:
         tuple: (completion_code, reason_for_decision)
     """
-    
+    # Normalize the row once into the set of TRUE-valued flags, then build a
+    # hashable key from O(1) membership tests. Repeated flag combinations
+    # (the common case across participants) hit the lru_cache below instead
+    # of re-running the priority ladder. Rows loaded via
+    # load_participant_flags carry the set precomputed under '_truthy'.
+    true_flags = csv_row.get('_truthy')
+    if true_flags is None:
+        true_flags = {k for k, v in csv_row.items() if isinstance(v, str) and v.strip().upper() == 'TRUE'}
+    flag_key = tuple(flag in true_flags for flag in _RELEVANT_FLAGS)
+    approved_not_false = csv_row.get('approved', '').strip().upper() != 'FALSE'
+    return _determine_completion_code_cached(flag_key, approved_not_false)
+
+@functools.lru_cache(maxsize=256)
+def _determine_completion_code_cached(flag_key: tuple, approved_not_false: bool) -> tuple[str | None, str]:
+    """Priority ladder over the normalized flag tuple. Cached per combination."""
+    (no_consent, failed_attention,
+     did_not_understand, occupation_not_confirmed, insufficient_experience,
+     screened_out, incomplete_other, completed_survey) = flag_key
+
+    # Fast path: the overwhelming majority of rows are clean completions, so
+    # check the unambiguously-approved case first. Only rows with no
+    # rejection/screening flag at all can short-circuit here, which keeps the
+    # priority semantics of the ladder below intact.
+    if completed_survey and approved_not_false and not (
+            no_consent or failed_attention or did_not_understand
+            or occupation_not_confirmed or insufficient_experience
+            or screened_out or incomplete_other):
+        return COMPLETION_CODES["APPROVED"], "Participant successfully completed the study and met all requirements."
+
     # Check for no consent (highest priority)
-    if csv_row.get('no_consent', '').strip().upper() == 'TRUE':
+    if no_consent:
         return COMPLETION_CODES["NO_CONSENT"], "Participant did not provide valid consent to participate in this research study. Consent is required for all participants as per ethical research guidelines and institutional requirements."
-    
+
     # Check for failed attention checks
-    if csv_row.get('failed_two_plus_attention_checks', '').strip().upper() == 'TRUE':
+    if failed_attention:
         return COMPLETION_CODES["FAILED_ATTENTION"], "Participant failed two or more attention checks, indicating insufficient attention to study requirements."
-    
+
     # Check for other screening issues
-    screening_flags = [
-        'did_not_understand_tasks',
-        'occupation_not_confirmed', 
-        'insufficient_work_experience'
-    ]
-    
-    for flag in screening_flags:
-        if csv_row.get(flag, '').strip().upper() == 'TRUE':
-            return COMPLETION_CODES["SCREENED_OUT"], f"Participant was screened out due to: {flag.replace('_', ' ')}"
-    
+    screening_hits = (did_not_understand, occupation_not_confirmed, insufficient_experience)
+    for flag, hit in zip(_SCREENING_FLAGS, screening_hits):
+        if hit:
+            return COMPLETION_CODES["SCREENED_OUT"], _SCREENING_REASONS[flag]
+
     # Check if they were screened out for other reasons
-    if csv_row.get('screened_out', '').strip().upper() == 'TRUE':
+    if screened_out:
         return COMPLETION_CODES["SCREENED_OUT"], "Participant was screened out during the study process."
-    
+
     # Check if study was incomplete for other reasons
-    if csv_row.get('incomplete_survey_other_reasons', '').strip().upper() == 'TRUE':
+    if incomplete_other:
         return COMPLETION_CODES["FAILED_ATTENTION"], "Participant did not complete the survey for other reasons indicating insufficient engagement."
-    
+
     # Default case - should be approved
-    if csv_row.get('completed_survey', '').strip().upper() == 'TRUE' and csv_row.get('approved', '').strip().upper() != 'FALSE':
+    if completed_survey and approved_not_false:
         return COMPLETION_CODES["APPROVED"], "Participant successfully completed the study and met all requirements."
-    
+
     # Fallback - manual review needed
     return None, "Unable to determine appropriate completion code - requires manual review."
 
-def get_api_action_for_completion_code(completion_code):
+def get_api_action_for_completion_code(completion_code: str) -> str:
     """
     Determines what API action to take based on the completion code.
     
@@ -69,35 +143,25 @@ def get_api_action_for_completion_code(completion_code):
     Returns:
         str: The action to take ("SKIP", "REJECT", "SCREEN_OUT")
     """
-    if completion_code == COMPLETION_CODES["APPROVED"]:
-        return "SKIP"  # Auto-approves, no action needed
-    elif completion_code == COMPLETION_CODES["SCREENED_OUT"]:
-        return "SCREEN_OUT"  # Use bulk screen out endpoint
-    elif completion_code in [COMPLETION_CODES["FAILED_ATTENTION"], COMPLETION_CODES["NO_CONSENT"]]:
-        return "REJECT"  # Use reject action
-    else:
-        return "MANUAL_REVIEW"  # Unknown code, needs manual review
+    return _ACTION_BY_CODE.get(completion_code, "MANUAL_REVIEW")  # Unknown code -> manual review
 
 # === COMPLETION CODE REVERSE LOOKUP === #
-def get_code_name(completion_code):
+def get_code_name(completion_code: str) -> str:
     """Get the human-readable name for a completion code."""
     if not completion_code:
         return ""
-    
-    for name, code in COMPLETION_CODES.items():
-        if code == completion_code:
-            return name
-    return f"UNKNOWN({completion_code})"
 
-def is_known_completion_code(completion_code):
+    return _CODE_TO_NAME.get(completion_code, f"UNKNOWN({completion_code})")
+
+def is_known_completion_code(completion_code: str) -> bool:
     """Check if a completion code is in our expected set."""
-    return completion_code in COMPLETION_CODES.values()
+    return completion_code in _CODE_SET
 
-def get_all_completion_codes():
+def get_all_completion_codes() -> list:
     """Get all configured completion codes as a list."""
     return list(COMPLETION_CODES.values())
 
-def analyze_completion_code(completion_code):
+def analyze_completion_code(completion_code: str) -> dict:
     """
     Analyze a completion code and return detailed information.
     
@@ -114,30 +178,16 @@ def analyze_completion_code(completion_code):
             'description': 'No completion code provided'
         }
     
-    if completion_code in COMPLETION_CODES.values():
+    if completion_code in _CODE_SET:
         # Find which type it is
         code_name = get_code_name(completion_code)
-        
-        expected_outcomes = {
-            'APPROVED': 'AUTO_APPROVE',
-            'SCREENED_OUT': 'SCREENED_OUT_WITH_PAYMENT', 
-            'FAILED_ATTENTION': 'REJECT',
-            'NO_CONSENT': 'REJECT'
-        }
-        
-        descriptions = {
-            'APPROVED': 'Participant completed successfully and should be auto-approved',
-            'SCREENED_OUT': 'Participant was screened out and should receive screening payment',
-            'FAILED_ATTENTION': 'Participant failed attention checks and should be rejected',
-            'NO_CONSENT': 'Participant did not provide consent and should be rejected'
-        }
-        
+
         return {
             'code': completion_code,
             'known': True,
             'meaning': code_name,
-            'expected_outcome': expected_outcomes.get(code_name, 'UNKNOWN'),
-            'description': descriptions.get(code_name, 'Known completion code')
+            'expected_outcome': _EXPECTED_OUTCOMES.get(code_name, 'UNKNOWN'),
+            'description': _DESCRIPTIONS.get(code_name, 'Known completion code')
         }
     else:
         return {
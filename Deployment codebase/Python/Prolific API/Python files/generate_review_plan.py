@@ -15,7 +15,12 @@ Usage:
 import sys
 import os
 import csv
+import itertools
 import json
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
 
 # Adjust sys.path to import modules from the parent directory
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -40,64 +45,89 @@ except ImportError:
 
 CSV_COLUMN_PROLIFIC_ID = "prolific_id"
 
+# Completion-code categories used to validate the local decision against the
+# code Qualtrics actually assigned.
+# (This mapping should align with your R script logic.)
+_APPROVED_CODES = frozenset({'C1DQRLH1', 'COMPLETION_CODE_APPROVED'})
+_REJECT_CODES = frozenset({'TIMEOUT', 'FAILED_ATTENTION'})
+_SCREEN_CODES = frozenset({'NO_CONSENT', 'SCREENED_OUT'})
+
+# (code category, local status) combinations that count as a MATCH, mapped to
+# the action proposed for each.
+_MATCH_ACTIONS = {
+    ('APPROVED', 'APPROVED'): 'APPROVE',
+    ('REJECT', 'REJECTED'): 'REJECT',
+    ('SCREEN', 'SCREENED-OUT'): 'SCREEN_OUT',
+    ('SCREEN', 'REJECTED'): 'REJECT',
+}
+
+def _completion_code_category(completion_code):
+    """Bucket a Qualtrics completion code into its decision category."""
+    if completion_code in _APPROVED_CODES:
+        return 'APPROVED'
+    if completion_code in _REJECT_CODES:
+        return 'REJECT'
+    if completion_code in _SCREEN_CODES:
+        return 'SCREEN'
+    return None
+
+def iter_study_submissions(study_id):
+    """
+    Yields submissions for a specific Prolific study, following API pagination
+    page by page instead of materializing the whole list.
+
+    Requests server-side ordering by started_at, so no client-side sort is
+    needed to get a consistent order.
+
+    Raises:
+        RuntimeError: If any page fetch fails. A truncated list must not be
+            mistaken for a complete one — the review plan would silently
+            cover only part of the study's submissions.
+    """
+    endpoint = f'/studies/{study_id}/submissions/'
+    params = {'ordering': 'started_at'}
+
+    while endpoint:
+        response = prolific_utils.make_api_request(method='GET', endpoint=endpoint, params=params)
+        if not response or 'results' not in response:
+            raise RuntimeError(f"Failed to retrieve submissions page for study {study_id}.")
+
+        yield from response['results']
+
+        # Follow the next-page link if the API provides one.
+        next_url = (response.get('_links', {}).get('next') or {}).get('href') or response.get('next')
+        if next_url:
+            endpoint = next_url.replace(config.BASE_URL, '', 1)
+            params = None  # The next-page URL already carries its query string
+        else:
+            endpoint = None
+
 def get_study_submissions(study_id):
     """
     Retrieves a list of submissions for a specific Prolific study.
+
+    Returns None if any page fetch fails, so the caller treats the run as an
+    error instead of planning from a partial submission list.
     """
     print(f"\nAttempting to retrieve submissions for Study ID: {study_id}")
-    endpoint = f'/studies/{study_id}/submissions/'
-    submissions_response = prolific_utils.make_api_request(method='GET', endpoint=endpoint)
-
-    if submissions_response and 'results' in submissions_response:
-        submissions_list = submissions_response['results']
-        print(f"Successfully retrieved {len(submissions_list)} submission(s) for study {study_id}.")
-        
-        # Sort submissions by the time they were started to ensure a consistent order
-        submissions_list.sort(key=lambda x: x.get('started_at', ''))
-        
-        return submissions_list
-    else:
-        print(f"Failed to retrieve submissions for study {study_id}.")
-        return []
+    try:
+        submissions_list = list(iter_study_submissions(study_id))
+    except RuntimeError as e:
+        print(f"ERROR: {e}")
+        return None
+    print(f"Successfully retrieved {len(submissions_list)} submission(s) for study {study_id}.")
+    return submissions_list
 
 def load_participant_flags(csv_filepath):
     """
     Loads participant flags from the specified local CSV file.
     Returns a dictionary mapping prolific_id to the full CSV row.
+
+    Parsing is done with pandas (C tokenizer) rather than a row-by-row
+    DictReader loop; filtering and deduplication are vectorized.
     """
-    participant_data = {}
-    
     try:
-        with open(csv_filepath, mode='r', encoding='utf-8', newline='') as infile:
-            reader = csv.DictReader(infile)
-            required_columns = [CSV_COLUMN_PROLIFIC_ID, 'status']
-            
-            # Check if required columns exist
-            if not all(col in reader.fieldnames for col in required_columns):
-                print(f"ERROR: CSV file must contain columns: {required_columns}")
-                print(f"Found columns: {reader.fieldnames}")
-                return None
-
-            print(f"CSV columns found: {reader.fieldnames}")
-
-            for row_num, row in enumerate(reader, 1):
-                prolific_id = row.get(CSV_COLUMN_PROLIFIC_ID, '').strip()
-
-                if not prolific_id:
-                    print(f"WARNING: Skipping row {row_num} due to missing '{CSV_COLUMN_PROLIFIC_ID}'.")
-                    continue
-                
-                # Skip header-like rows
-                if prolific_id.upper() in ['PROLIFIC_ID', 'ATTN CHECKS', 'NO CONSENT']:
-                    print(f"INFO: Skipping header/example row {row_num}: {prolific_id}")
-                    continue
-                
-                if prolific_id not in participant_data:
-                    participant_data[prolific_id] = row
-
-        print(f"Successfully loaded {len(participant_data)} participant records from {csv_filepath}.")
-        return participant_data
-        
+        df = pd.read_csv(csv_filepath, dtype=str, keep_default_na=False)
     except FileNotFoundError:
         print(f"ERROR: CSV file not found at {csv_filepath}")
         return None
@@ -105,13 +135,44 @@ def load_participant_flags(csv_filepath):
         print(f"ERROR: Could not read CSV file {csv_filepath}. Error: {e}")
         return None
 
-def generate_review_plan(prolific_submissions, participant_data):
+    required_columns = [CSV_COLUMN_PROLIFIC_ID, 'status']
+
+    # Check if required columns exist
+    if not all(col in df.columns for col in required_columns):
+        print(f"ERROR: CSV file must contain columns: {required_columns}")
+        print(f"Found columns: {list(df.columns)}")
+        return None
+
+    print(f"CSV columns found: {list(df.columns)}")
+
+    # Drop rows with missing IDs, header/example rows, and duplicate IDs
+    # (keeping the first occurrence, matching the old loop's behavior).
+    df[CSV_COLUMN_PROLIFIC_ID] = df[CSV_COLUMN_PROLIFIC_ID].str.strip()
+    df = df[df[CSV_COLUMN_PROLIFIC_ID] != '']
+    df = df[~df[CSV_COLUMN_PROLIFIC_ID].str.upper().isin(['PROLIFIC_ID', 'ATTN CHECKS', 'NO CONSENT'])]
+    df = df.drop_duplicates(CSV_COLUMN_PROLIFIC_ID, keep='first')
+
+    participant_data = df.set_index(CSV_COLUMN_PROLIFIC_ID, drop=False).to_dict('index')
+
+    # Pre-normalize each row's TRUE-valued flags once at load time, so
+    # determine_completion_code does set-membership tests instead of
+    # re-running strip/upper string ops per decision.
+    for row in participant_data.values():
+        row['_truthy'] = frozenset(
+            k for k, v in row.items() if isinstance(v, str) and v.strip().lower() == 'true'
+        )
+
+    print(f"Successfully loaded {len(participant_data)} participant records from {csv_filepath}.")
+    return participant_data
+
+def iter_review_plan(prolific_submissions, participant_data, validation_summary):
     """
-    Generates a plan by comparing actual completion codes with local status decisions.
+    Yields review-plan rows by comparing actual completion codes with local
+    status decisions, one submission at a time.
+
+    Tallies into the caller-supplied validation_summary dict as it goes, so
+    the rows can be streamed straight to CSV without materializing the plan.
     """
-    review_plan = []
-    validation_summary = {'matches': 0, 'mismatches': 0, 'csv_only': 0, 'code_only': 0, 'neither': 0}
-    
     for sub in prolific_submissions:
         submission_id = sub.get('id')
         participant_id = sub.get('participant_id')
@@ -136,20 +197,14 @@ def generate_review_plan(prolific_submissions, participant_data):
             
             # Compare actual completion code with local decision
             if actual_completion_code and local_status:
-                # Map completion codes to expected local statuses
-                # (This mapping should align with your R script logic)
-                if ((actual_completion_code in ['C1DQRLH1', 'COMPLETION_CODE_APPROVED'] and local_status == "APPROVED") or
-                    (actual_completion_code in ['TIMEOUT', 'FAILED_ATTENTION'] and local_status == "REJECTED") or  
-                    (actual_completion_code in ['NO_CONSENT', 'SCREENED_OUT'] and local_status in ["SCREENED-OUT", "REJECTED"])):
+                # Dispatch through the precomputed decision table instead of
+                # rebuilding the code lists on every iteration.
+                category = _completion_code_category(actual_completion_code)
+                match_action = _MATCH_ACTIONS.get((category, local_status))
+                if match_action:
                     validation_status = "MATCH"
                     validation_summary['matches'] += 1
-                    # Propose action based on local status
-                    if local_status == "APPROVED":
-                        proposed_action = "APPROVE"
-                    elif local_status == "REJECTED":
-                        proposed_action = "REJECT"
-                    elif local_status == "SCREENED-OUT":
-                        proposed_action = "SCREEN_OUT"
+                    proposed_action = match_action
                 else:
                     validation_status = "MISMATCH"
                     validation_summary['mismatches'] += 1
@@ -187,7 +242,7 @@ def generate_review_plan(prolific_submissions, participant_data):
             else:
                 proposed_action = "MANUAL_REVIEW_NO_LOCAL_DATA"
 
-        review_plan.append({
+        yield {
             "prolific_submission_id": submission_id,
             "prolific_participant_id": participant_id,
             "current_prolific_status": current_status,
@@ -198,9 +253,12 @@ def generate_review_plan(prolific_submissions, participant_data):
             "validation_status": validation_status,
             "proposed_action": proposed_action,
             "notes": notes
-        })
+        }
 
-    # Print validation summary
+def print_validation_summary(validation_summary):
+    """
+    Prints the match/mismatch summary tallied while streaming the plan.
+    """
     print(f"\n=== VALIDATION SUMMARY ===")
     print(f"MATCHES (local and Qualtrics agree): {validation_summary['matches']}")
     print(f"MISMATCHES (local and Qualtrics disagree): {validation_summary['mismatches']}")
@@ -214,22 +272,25 @@ def generate_review_plan(prolific_submissions, participant_data):
     else:
         print(f"\n✅ No mismatches found! Local analysis and Qualtrics are in agreement.")
 
-    return review_plan
-
 def save_review_plan_to_csv(review_plan, output_filepath="review_plan_with_validation.csv"):
     """
-    Saves the generated review plan with validation results to a CSV file.
+    Streams the review plan to a CSV file as rows are generated.
+
+    Accepts any iterable of plan rows (typically the iter_review_plan
+    generator), so the full plan is never held in memory. The action summary
+    is tallied while writing.
     """
-    if not review_plan:
+    review_plan = iter(review_plan)
+    first_row = next(review_plan, None)
+    if first_row is None:
         print("No review plan data to save.")
         return
-    
-    output_dir = os.getcwd()
-    full_output_path = os.path.join(output_dir, output_filepath)
+
+    full_output_path = Path(output_filepath).resolve()
 
     fieldnames = [
-        "prolific_submission_id", 
-        "prolific_participant_id", 
+        "prolific_submission_id",
+        "prolific_participant_id",
         "current_prolific_status",
         "actual_completion_code",
         "local_status",
@@ -239,27 +300,21 @@ def save_review_plan_to_csv(review_plan, output_filepath="review_plan_with_valid
         "proposed_action",
         "notes"
     ]
-    
+
     try:
+        action_counts = Counter()
         with open(full_output_path, mode='w', encoding='utf-8', newline='') as outfile:
             writer = csv.DictWriter(outfile, fieldnames=fieldnames)
             writer.writeheader()
-            writer.writerows(review_plan)
+            for row in itertools.chain([first_row], review_plan):
+                writer.writerow(row)
+                action_counts[row['proposed_action']] += 1
         print(f"\nReview plan with validation saved to: {full_output_path}")
-        
-        # Print action summary
-        action_counts = {}
-        validation_counts = {}
-        for row in review_plan:
-            action = row['proposed_action']
-            validation = row['validation_status']
-            action_counts[action] = action_counts.get(action, 0) + 1
-            validation_counts[validation] = validation_counts.get(validation, 0) + 1
-        
+
         print("\nProposed Actions:")
         for action, count in action_counts.items():
             print(f"  {action}: {count}")
-            
+
     except Exception as e:
         print(f"ERROR: Could not save review plan to CSV at {full_output_path}. Error: {e}")
 
@@ -295,8 +350,10 @@ if __name__ == "__main__":
         elif not participant_flags:
             print("No valid participant data loaded from CSV (check for errors above). Cannot generate plan.")
         else:
-            plan = generate_review_plan(prolific_submissions, participant_flags)
-            save_review_plan_to_csv(plan, "review_plan_with_validation.csv")
+            validation_summary = {'matches': 0, 'mismatches': 0, 'csv_only': 0, 'code_only': 0, 'neither': 0}
+            plan_rows = iter_review_plan(prolific_submissions, participant_flags, validation_summary)
+            save_review_plan_to_csv(plan_rows, "review_plan_with_validation.csv")
+            print_validation_summary(validation_summary)
     else:
         print("Could not generate review plan due to errors.")
 
@@ -5,23 +5,49 @@ This module provides common functions for making requests, handling authenticati
 and processing responses to reduce code duplication in the main scripts.
 """
 
+import functools
+import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import config  # Import configuration settings from config.py
 
+logger = logging.getLogger(__name__)
+
+# Shared session so every API call reuses pooled connections instead of
+# paying a fresh TCP/TLS handshake. Transient 429/5xx responses are retried
+# with exponential backoff at the adapter level.
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+# Prefer orjson for response decoding when available (C implementation,
+# several times faster on large submission payloads); fall back to stdlib.
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+@functools.lru_cache(maxsize=1)
 def get_auth_headers():
     """
     Creates the standard authentication headers required for Prolific API requests.
 
-    Reads the API token from the config.py file.
+    Reads the API token from the config.py file. The token never changes
+    within a process, so the headers dict is built once and cached.
 
     Returns:
         dict: A dictionary containing the 'Authorization' and 'Content-Type' headers.
               Returns None if the API token is not set or is the placeholder.
     """
     if not config.API_TOKEN or config.API_TOKEN == "YOUR_SECRET_API_TOKEN_HERE":
-        print("ERROR: API_TOKEN is not set in config.py or is still the placeholder.")
-        print("Please add your actual Prolific API token to config.py before running.")
+        logger.error("API_TOKEN is not set in config.py or is still the placeholder.")
+        logger.error("Please add your actual Prolific API token to config.py before running.")
         return None
 
     return {
@@ -54,14 +80,16 @@ def make_api_request(method, endpoint, json_data=None, params=None):
 
     full_url = f"{config.BASE_URL}{endpoint}"
 
-    print(f"--- Making {method.upper()} request to: {full_url} ---")
+    # All per-call chatter is DEBUG: the %-style arguments are only formatted
+    # when the level is enabled, so hot loops (pagination, polling) pay nothing.
+    logger.debug("Making %s request to: %s", method.upper(), full_url)
     if json_data:
-        print(f"Request Body: {json.dumps(json_data, indent=2)}") # Pretty print JSON body
+        logger.debug("Request Body: %s", json_data)
     if params:
-        print(f"URL Parameters: {params}")
+        logger.debug("URL Parameters: %s", params)
 
     try:
-        response = requests.request(
+        response = _SESSION.request(
             method=method,
             url=full_url,
             headers=headers,
@@ -72,39 +100,33 @@ def make_api_request(method, endpoint, json_data=None, params=None):
         # Raise an exception for bad status codes (4xx client errors or 5xx server errors)
         response.raise_for_status()
 
-        print(f"API Call Successful (Status Code: {response.status_code})")
+        logger.debug("API Call Successful (Status Code: %s)", response.status_code)
 
         # Handle cases where the response might be empty (e.g., 204 No Content)
         if response.status_code == 204 or not response.content:
             return {} # Return an empty dict for consistency
 
         # Attempt to parse the JSON response
-        return response.json()
+        return _loads(response.content)
 
     except requests.exceptions.RequestException as e:
-        print(f"\n--- API Request Failed --- ")
-        print(f"Error Type: {type(e).__name__}")
-        print(f"Error Message: {e}")
+        logger.error("API Request Failed: %s: %s", type(e).__name__, e)
 
         # Try to get more details from the response if it exists
         if e.response is not None:
-            print(f"Status Code: {e.response.status_code}")
+            logger.error("Status Code: %s", e.response.status_code)
             try:
                 # Prolific API often returns detailed errors in JSON format
                 error_details = e.response.json()
-                print(f"API Error Details: {json.dumps(error_details, indent=2)}")
+                logger.error("API Error Details: %s", json.dumps(error_details, indent=2))
             except json.JSONDecodeError:
-                # If the response isn't JSON, print the raw text
-                print(f"Response Body (Non-JSON): {e.response.text}")
+                # If the response isn't JSON, log the raw text
+                logger.error("Response Body (Non-JSON): %s", e.response.text)
         else:
-            print("No response received from the server (e.g., network issue).")
+            logger.error("No response received from the server (e.g., network issue).")
 
-        print("--------------------------\n")
         return None
     except json.JSONDecodeError:
-        print(f"\n--- API Response JSON Parsing Failed ---")
-        print(f"Status Code: {response.status_code}")
-        print(f"Could not decode JSON from response body:")
-        print(response.text)
-        print("--------------------------------------\n")
+        logger.error("API Response JSON Parsing Failed (Status Code: %s)", response.status_code)
+        logger.error("Could not decode JSON from response body: %s", response.text)
         return None
@@ -1,10 +1,18 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 import os
+import shutil
 import zipfile
-import io
+import tempfile
+import logging
 import config # Import the configuration file
 
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
 # --- Configuration ---
 # Details are now imported from config.py
 API_TOKEN = config.QUALTRICS_API_TOKEN
@@ -25,34 +33,55 @@ HEADERS = {
     "Content-Type": "application/json",
 }
 
+# One session for every call in the export flow (create, poll, download):
+# the TLS handshake is paid once and HTTP keep-alive reuses the connection.
+# Transient 429/5xx responses are retried with exponential backoff at the
+# adapter level (POST included: creating an export twice is harmless), so a
+# single flake no longer aborts the whole export.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=10,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=["GET", "POST", "PUT"], respect_retry_after_header=True)
+))
+_SESSION.headers.update(HEADERS)
+
 def create_export_request(survey_id: str, file_format: str) -> str | None:
     """Initiates a response export request."""
     payload = {
         "format": file_format,
         "surveyId": survey_id
     }
-    print(f"Initiating export for survey ID: {survey_id} in format: {file_format}...")
-    response = requests.post(CREATE_EXPORT_URL, headers=HEADERS, json=payload)
+    logger.info("Initiating export for survey ID: %s in format: %s...", survey_id, file_format)
+    response = _SESSION.post(CREATE_EXPORT_URL, json=payload)
 
     if response.status_code == 200:
         response_data = response.json()
         # Try both progressId and id fields as the API format might vary
         progress_id = response_data.get("result", {}).get("progressId") or response_data.get("result", {}).get("id")
         if progress_id:
-            print(f"Export initiated. Progress ID: {progress_id}")
+            logger.info("Export initiated. Progress ID: %s", progress_id)
             return progress_id
         else:
-            print(f"Error: Could not get progressId from response: {response_data}")
+            logger.error("Could not get progressId from response: %s", response_data)
             return None
     else:
-        print(f"Error creating export: {response.status_code} - {response.text}")
+        logger.error("Error creating export: %s - %s", response.status_code, response.text)
         return None
 
-def get_export_progress(progress_id: str) -> tuple[str | None, str | None]:
-    """Checks the progress of an ongoing export."""
+def get_export_progress(progress_id: str) -> tuple[str | None, str | None, str | None]:
+    """Checks the progress of an ongoing export.
+
+    Returns:
+        A (status, file_id, percent_complete) tuple. file_id is only set
+        once status is "complete".
+    """
     url = GET_PROGRESS_URL.format(exportProgressId=progress_id)
-    print(f"Checking export progress for ID: {progress_id}...")
-    response = requests.get(url, headers=HEADERS)
+    # Per-poll chatter stays at DEBUG so repeated polls are free when the
+    # logger sits at the default INFO level.
+    logger.debug("Checking export progress for ID: %s...", progress_id)
+    response = _SESSION.get(url)
 
     if response.status_code == 200:
         response_data = response.json()
@@ -61,108 +90,144 @@ def get_export_progress(progress_id: str) -> tuple[str | None, str | None]:
         file_id = response_data.get("result", {}).get("fileId") or progress_id  # Use progress_id as file_id if fileId not present
 
         if status:
-            print(f"Status: {status}, Percent Complete: {percent_complete}%")
+            logger.debug("Status: %s, Percent Complete: %s%%", status, percent_complete)
             if status == "complete":
-                return "complete", file_id
+                return "complete", file_id, percent_complete
             elif status == "failed":
-                print(f"Error: Export failed. Response: {response_data}")
-                return "failed", None
-            return status, None  # Still in progress or other status
+                logger.error("Export failed. Response: %s", response_data)
+                return "failed", None, percent_complete
+            return status, None, percent_complete  # Still in progress or other status
         else:
-            print(f"Error: Could not get status from progress response: {response_data}")
-            return "error", None
+            logger.error("Could not get status from progress response: %s", response_data)
+            return "error", None, None
     else:
-        print(f"Error checking progress: {response.status_code} - {response.text}")
-        return "error", None
+        logger.error("Error checking progress: %s - %s", response.status_code, response.text)
+        return "error", None, None
+
+# Polling schedule: start fast so quick exports finish quickly, grow the
+# delay geometrically so slow exports don't hammer the API, and never wait
+# longer than POLL_MAX between checks.
+POLL_INITIAL = 0.25
+POLL_BASE = 1.3
+POLL_MAX = 30.0
+
+def wait_for_export(progress_id: str, initial: float = POLL_INITIAL, max_delay: float = POLL_MAX, factor: float = POLL_BASE) -> str | None:
+    """Polls the export until it completes, backing off exponentially.
+
+    Sleeps min(initial * factor**k, max_delay) between polls, so a
+    multi-minute export costs O(log T) progress requests instead of one
+    every fixed interval. The delay resets to `initial` whenever the
+    reported status or percent-complete changes, keeping latency low while
+    the export is actively advancing.
+
+    Returns:
+        The file ID to download on success, or None if the export failed.
+    """
+    delay = initial
+    last_seen = None
+    while True:
+        status, file_id, percent_complete = get_export_progress(progress_id)
+        if status == "complete" and file_id:
+            logger.info("Export complete and file is ready for download.")
+            return file_id
+        if status in ["failed", "error"]:
+            logger.error("Export process failed or encountered an error.")
+            return None
+        seen = (status, percent_complete)
+        if seen != last_seen:
+            delay = initial
+            last_seen = seen
+        logger.debug("Waiting %.2f seconds before checking progress again...", delay)
+        time.sleep(delay)
+        delay = min(delay * factor, max_delay)
 
 def download_export_file(file_id: str, output_dir: str, output_filename: str, file_format: str):
     """Downloads the exported file and saves it."""
     url = GET_FILE_URL.format(exportProgressId=file_id) # Note: Qualtrics uses progressId as fileId here
-    print(f"Downloading file for file ID: {file_id}...")
-    response = requests.get(url, headers=HEADERS, stream=True)
+    logger.info("Downloading file for file ID: %s...", file_id)
+    response = _SESSION.get(url, stream=True)
 
     if response.status_code == 200:
-        # Ensure output directory exists
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            print(f"Created output directory: {output_dir}")
+        # Ensure output directory exists (one mkdir syscall, no stat-then-mkdir race)
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Stream the archive to a temp file in 1 MiB chunks: peak memory stays
+        # at chunk_size regardless of export size, and the error paths below
+        # can keep the file with a rename instead of rewriting its bytes.
+        # The temp file lives in output_dir so os.replace never crosses
+        # filesystems.
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".zip", dir=output_dir) as tmp:
+            tmp_path = tmp.name
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                tmp.write(chunk)
 
         # The file is a ZIP archive, even for CSV. We need to extract it.
         try:
-            with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-                # List files in zip, find the one with the survey name or common data file extensions
-                exported_filename_in_zip = ""
-                for name_in_zip in z.namelist():
-                    # Often the filename inside the zip matches the survey name or is a generic data file name.
-                    # This logic might need adjustment based on actual naming conventions from Qualtrics.
-                    if name_in_zip.lower().endswith(f".{file_format.lower()}"):
-                         exported_filename_in_zip = name_in_zip
-                         break
-                
-                if not exported_filename_in_zip and z.namelist():
-                    # If specific format not found, pick the first one (assuming it's the data)
-                    # This is a fallback and might not always be correct.
-                    print(f"Warning: Could not find a definitive '.{file_format}' file. Extracting '{z.namelist()[0]}'.")
-                    exported_filename_in_zip = z.namelist()[0]
-
+            with zipfile.ZipFile(tmp_path) as z:
+                # Pick the data file in a single pass over the archive entries.
+                # Often the filename inside the zip matches the survey name or is
+                # a generic data file name; fall back to the first entry if no
+                # entry carries the expected extension.
+                infos = z.infolist()
+                suffix = f".{file_format.lower()}"
+                exported_filename_in_zip = next(
+                    (info.filename for info in infos if info.filename.lower().endswith(suffix)),
+                    None
+                )
+
+                if not exported_filename_in_zip and infos:
+                    logger.warning("Could not find a definitive '.%s' file. Extracting '%s'.", file_format, infos[0].filename)
+                    exported_filename_in_zip = infos[0].filename
 
                 if exported_filename_in_zip:
                     extracted_file_path = os.path.join(output_dir, f"{output_filename}.{file_format}")
-                    with open(extracted_file_path, 'wb') as f_out:
-                        f_out.write(z.read(exported_filename_in_zip))
-                    print(f"File extracted and saved to: {extracted_file_path}")
+                    # Stream the member straight to disk instead of materializing
+                    # it in memory with z.read().
+                    with z.open(exported_filename_in_zip) as f_src, open(extracted_file_path, 'wb') as f_out:
+                        shutil.copyfileobj(f_src, f_out, length=1 << 20)
+                    logger.info("File extracted and saved to: %s", extracted_file_path)
                 else:
-                    print(f"Error: Could not find the data file within the downloaded ZIP archive.")
-                    # Save the zip for inspection if extraction fails
+                    logger.error("Could not find the data file within the downloaded ZIP archive.")
+                    # Keep the zip for inspection if extraction fails
                     zip_path = os.path.join(output_dir, f"{output_filename}_archive.zip")
-                    with open(zip_path, 'wb') as f_zip:
-                        f_zip.write(response.content)
-                    print(f"Downloaded ZIP archive saved to: {zip_path} for inspection.")
+                    os.replace(tmp_path, zip_path)
+                    logger.info("Downloaded ZIP archive saved to: %s for inspection.", zip_path)
+                    return
 
         except zipfile.BadZipFile:
-            print("Error: Downloaded file is not a valid ZIP archive.")
-            # Fallback: Save the raw content if it's not a zip (e.g., if API behavior changes)
+            logger.error("Downloaded file is not a valid ZIP archive.")
+            # Fallback: keep the raw content if it's not a zip (e.g., if API behavior changes)
             raw_file_path = os.path.join(output_dir, f"{output_filename}_raw.{file_format}")
-            with open(raw_file_path, 'wb') as f_raw:
-                f_raw.write(response.content)
-            print(f"Raw downloaded content saved to: {raw_file_path}")
+            os.replace(tmp_path, raw_file_path)
+            logger.info("Raw downloaded content saved to: %s", raw_file_path)
+            return
         except Exception as e:
-            print(f"An error occurred during ZIP extraction: {e}")
+            logger.error("An error occurred during ZIP extraction: %s", e)
             zip_path = os.path.join(output_dir, f"{output_filename}_archive_error.zip")
-            with open(zip_path, 'wb') as f_zip:
-                f_zip.write(response.content)
-            print(f"Downloaded ZIP archive saved to: {zip_path} due to extraction error.")
+            os.replace(tmp_path, zip_path)
+            logger.info("Downloaded ZIP archive saved to: %s due to extraction error.", zip_path)
+            return
+
+        os.remove(tmp_path)
 
     else:
-        print(f"Error downloading file: {response.status_code} - {response.text}")
+        logger.error("Error downloading file: %s - %s", response.status_code, response.text)
 
 def main():
     """Main function to orchestrate the export process."""
     if not all([API_TOKEN, DATA_CENTER_ID, SURVEY_ID]):
-        print("Please ensure QUALTRICS_API_TOKEN, QUALTRICS_DATACENTER_ID, and QUALTRICS_SURVEY_ID are set in config.py")
+        logger.error("Please ensure QUALTRICS_API_TOKEN, QUALTRICS_DATACENTER_ID, and QUALTRICS_SURVEY_ID are set in config.py")
         return
 
     progress_id = create_export_request(SURVEY_ID, FILE_FORMAT)
 
     if progress_id:
-        file_id_to_download = None
-        while True:
-            status, file_id = get_export_progress(progress_id)
-            if status == "complete" and file_id:
-                file_id_to_download = file_id
-                print("Export complete and file is ready for download.")
-                break
-            elif status in ["failed", "error"]:
-                print("Export process failed or encountered an error. Exiting.")
-                return
-            # Wait before checking progress again
-            print("Waiting for 5 seconds before checking progress again...")
-            time.sleep(5)
-        
+        file_id_to_download = wait_for_export(progress_id)
+
         if file_id_to_download:
             download_export_file(file_id_to_download, OUTPUT_DIR, OUTPUT_FILENAME, FILE_FORMAT)
         else:
-            print("Could not retrieve file ID for download.")
+            logger.error("Could not retrieve file ID for download.")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,10 +1,24 @@
+import csv
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import logging
 import os
 from typing import List, Optional
 import traceback # Added for more detailed exception logging
 import config # Import our configuration
 
+logger = logging.getLogger(__name__)
+
+# Prefer orjson for encoding the PUT payload when available (C implementation,
+# noticeably faster on large flow elements); fall back to stdlib.
+try:
+    import orjson
+    _dumps = orjson.dumps
+except ImportError:
+    _dumps = json.dumps
+
 HIDDEN_OCCUPATION_NUMBERS_FILE = "qualtrics_hidden_occupation_numbers.txt"
 
 class QualtricsEmbeddedDataUpdater:
@@ -25,6 +39,18 @@ class QualtricsEmbeddedDataUpdater:
             "X-API-TOKEN": self.api_token,
             "Content-Type": "application/json"
         }
+        # Reuse one session for the GET-flow/PUT-element pair so the second
+        # request rides the already-open keep-alive connection. Transient
+        # 429/5xx responses are retried with backoff at the adapter level;
+        # the element PUT is idempotent, so retrying it is safe.
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=10,
+            max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                              allowed_methods=["GET", "PUT"], respect_retry_after_header=True)
+        ))
+        self.session.headers.update(self.headers)
 
     def update_hidden_occupation_numbers(self, occupation_numbers: List[int]) -> bool:
         """Updates an existing Embedded Data element named
@@ -47,7 +73,7 @@ class QualtricsEmbeddedDataUpdater:
             # 1. Fetch current flow definition
             flow_url = f"{self.base_url}/survey-definitions/{self.survey_id}/flow"
             print(f"Fetching survey flow from: {flow_url}")
-            flow_resp = requests.get(flow_url, headers=self.headers)
+            flow_resp = self.session.get(flow_url)
             
             print(f"Get flow response status: {flow_resp.status_code}")
             if flow_resp.status_code != 200:
@@ -78,10 +104,12 @@ class QualtricsEmbeddedDataUpdater:
                             target_element = el
                             
                             ed_field_obj["Value"] = occupation_numbers_str
-                            ed_field_obj["Type"] = "Custom" 
-                            print(f"    Updated field object locally: {json.dumps(ed_field_obj, indent=2)}")
+                            ed_field_obj["Type"] = "Custom"
+                            # Lazy %-formatting: the dict is only rendered when
+                            # DEBUG logging is actually enabled.
+                            logger.debug("Updated field object locally: %s", ed_field_obj)
                             field_found_in_element = True
-                            break 
+                            break
                 if target_element and field_found_in_element:
                     break 
             
@@ -89,17 +117,19 @@ class QualtricsEmbeddedDataUpdater:
                 target_flow_id = target_element['FlowID']
                 update_url = f"{flow_url}/{target_flow_id}"
                 print(f"Attempting to PUT updated element to: {update_url}")
-                print(f"Payload for PUT request (element FlowID: {target_flow_id}):\\n{json.dumps(target_element, indent=2)}")
-                update_resp = requests.put(update_url, headers=self.headers, json=target_element)
-                
+                logger.debug("Payload for PUT request (element FlowID: %s): %s", target_flow_id, target_element)
+                # The flow endpoint is PUT-only (no field-level PATCH), so the
+                # whole element must be sent; encode it once with the fastest
+                # available serializer. Content-Type is already on the session.
+                update_resp = self.session.put(update_url, data=_dumps(target_element))
+
                 print(f"Update flow element response status: {update_resp.status_code}")
-                print(f"Update flow element response text: {update_resp.text}")
 
                 if update_resp.status_code == 200:
                     print(f"Successfully updated hidden_occupation_numbers = {occupation_numbers_str} in element {target_flow_id}")
                     return True
                 else:
-                    print(f"Failed to update embedded data field in element {target_flow_id}.")
+                    print(f"Failed to update embedded data field in element {target_flow_id}. Response text: {update_resp.text}")
                     return False
             else:
                 print(f"Embedded data field 'hidden_occupation_numbers' not found in the survey flow. Please ensure it exists and is of Type 'EmbeddedData'.")
@@ -129,11 +159,21 @@ def main():
         file_path = os.path.join(script_dir, HIDDEN_OCCUPATION_NUMBERS_FILE)
         
         print(f"Attempting to read hidden occupation numbers from: {file_path}")
-        with open(file_path, 'r') as f:
+        with open(file_path, 'r', newline='') as f:
             line = f.readline().strip()
             if line:
-                occupation_numbers_to_hide = [int(num_str.strip()) for num_str in line.split(',') if num_str.strip().isdigit()]
-                if not occupation_numbers_to_hide and line: # handles cases like "a,b,c" or empty strings between commas
+                # csv.reader is a C-implemented tokenizer, so splitting the
+                # line costs no per-token Python bytecode; int() then both
+                # validates and converts each token in a single pass.
+                for num_str in next(csv.reader([line]), []):
+                    num_str = num_str.strip()
+                    if not num_str:
+                        continue
+                    try:
+                        occupation_numbers_to_hide.append(int(num_str))
+                    except ValueError:
+                        pass  # non-integer token; reported below if nothing parsed
+                if not occupation_numbers_to_hide: # handles cases like "a,b,c" or empty strings between commas
                     print(f"Warning: File '{file_path}' contained non-integer or improperly formatted data: '{line}'. Proceeding with empty list.")
             else:
                 print(f"Warning: File '{file_path}' is empty. No occupation numbers will be hidden.")
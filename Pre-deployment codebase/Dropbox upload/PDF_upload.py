@@ -1,3 +1,4 @@
+import hashlib
 import json
 import re
 import dropbox
@@ -12,7 +13,6 @@ from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple, Any
 import logging
 from dataclasses import dataclass
-import random
 import numpy as np
 
 # Configure logging
@@ -23,7 +23,16 @@ logger = logging.getLogger(__name__)
 EXCEL_FILE = '/Users/adamkuzee/MIT Dropbox/adam/LLM survey/FULL SURVEY/Code and data/FULL SURVEY data/Task instances/Unformatted/{INSET FILE NAME}'
 SAVE_DIRECTORY = '/Users/adamkuzee/MIT Dropbox/adam/LLM survey/FULL SURVEY/Code and data/FULL SURVEY data/Task instances/Formatted'
 SHEET_NAME = 'Sheet1'
-SAVE_INTERVAL = 50  # Save Excel file every 50 rows
+# Only these columns are ever read from the spreadsheet; loading the rest
+# just costs parse time and memory. order_models may be absent, hence the
+# callable usecols filter at the read_excel call site.
+LOAD_COLUMNS = ('Job', 'Task', 'order_models', 'Question',
+                'model1', 'model2', 'model3', 'model4', 'model5')
+# Output column order; also the keys of the columnar results store in main
+RESULT_COLUMNS = ('occupation_id', 'task_id', 'Job', 'Task', 'order_models',
+                  'Question', 'model1', 'model2', 'model3', 'model4', 'model5')
+SAVE_INTERVAL = 50  # Append progress rows every 50 rows
+PROGRESS_FILENAME = 'task_urls_HTML_benchmark_PDF_progress_v3.jsonl'
 MAX_CONCURRENT_UPLOADS = 20  # Increased for better parallelization
 MAX_RETRIES = 3
 RETRY_DELAY = 1
@@ -37,8 +46,28 @@ MODEL_NAMES = {
     'model5': 'Claude_3_Sonnet'
 }
 
-# Dropbox token
-DROPBOX_TOKEN = "sl.u.AFja3BrThYEsy5KU-O0f49LMhTOpi_B96Xl1sAlyG408ZBc67yCVwlK-aVUs2snMSPhCeDpD1HFAhdUgRjZq-fRbTG1YOZ5Z3B10SQXzOTpHpiC-i2PltdNusf_YCkOtS7I0EFCx0FXYyDHiLF2WhyV-HKlF3K4Lxt05wCgjDkUx6IL2k1U5nKomUL6FiAk9Q6ycYx_bhWJMSARGUkN3w5sJ6yFMcSsCSKaD6ZvwfuhB0u6WhF-vTl9MQrqCtm-J-o2lEZx-S8UVFfJwUUZf5W9OsISsSGaZG8UJx2WDU5RJxuI5SDaebvXge12A3Yb5vt_vj1UtmcUawavXHMJ0iw0wU3qAuCPzWbq4zc11d3PZjWIX6rmUQVRhbLTFx7_17QCbpDmc0bBOFaL5Afs7CI_D-iLDHnfcfxAFMaiAoOyg-5E3Lk1EKa3Ru7oRYZg3BM4PkpSmi0Nia7r7w-Rc4NWBVrWja_NZAC8o7-6CV1FaHJsVSUR_IpgjMH-Cumwxt2PRivsNaZ8cAMFJ9HSS6F37O6won0khJ1IrwhugzW56nppMd3Dr9BGNbDNaqd0K2y8fFmiVLnizGDbNAww89GzOd1lZYVqwq9B_hInDny96u6KuZUAI6rYdJfcPGHedV16e8xF8a6vLjjb2CzajswUCje77i-H_EvB3AFL3dvPK5Hv2NCBrOBp1Imsl4A1mpJNxsoYkuT-8lgVPOzJaEFFL_8SlhpfxqWEr6F6RqcdvYJeS0QIay_ss-9c-TZvJnYq4Gj9Zqr7CQWDcKwxLq7sV8TZ5YlOP9t-Myri9xG1d-r_EeSX6PztyaMrGpMZXmFEknrEpUOkZZmtxLvVvCbbnCsgGZQPFMSqcIRHLbFyaPpRu8glinwMtnjM1uYqdVSMntuaaXut6a_LIwFeLEj9M9zwrdUQY59TvKPYSntLXFn84ra-pHLPRAZ_ZQWEcQchqTrFI-ZvCdWgXSvmzB_uzl7XpFC68bhuFuVwIxfwN4wiV2F8d-_SJS-PQIwCj8gISAxuBYH40QEThOI_NHzbmRLMIm6wCHuJcm2rQuYYwUb7yptflOrgiQ1KY4LXKwk4CsZqD4yIsNXL-ejPLf6aMnnBm1_acf4TcAVtDFCJCSxZBecBdqsAQkJf3dORXsyhrAwsxoEFqweV8B442heaGEYeTKWrfnPOJMOY0tHAgaoiOcYZ1vAYl3A5wZbrl5fknf3skAfKo3pcmYK54-OE8KKYpysVX6YrrupmgrZqpz__vwrKR514UtPsXrbVRbhrcrjiiUMRRR_ybgTCIAtBhuRZVaVlmjBHJtUN4whisPZFuxtTJnYVATR-3Q0g7RtBmjmv87a6NJDg0qXUiELZKEDqipepca2OmX3EMWZnBXkuQPDTB41Era3YnpGtseUQ"
+# Precomputed filename templates, one per column: Question PDFs are just
+# task_id.pdf, model columns bake the model name in at import time so the
+# hot path is a single dict lookup + str.format instead of branches and a
+# MODEL_NAMES lookup per (task, column).
+FILENAME_FMT = {
+    'Question': '{tid}.pdf',
+    **{col: f'{{tid}}_model={name}.pdf' for col, name in MODEL_NAMES.items()}
+}
+
+# One executor shared by every make_pdf call. The old code built (and tore
+# down) a fresh 4-thread pool per column, so startup cost scaled with the
+# number of PDFs. Threads are the right pool type here: pdfkit shells out to
+# wkhtmltopdf, so the real work runs in subprocesses and the GIL is released
+# while Python just waits.
+# Sized at 2x cores (capped): each worker spends most of its time waiting on
+# its wkhtmltopdf subprocess, so modest oversubscription keeps cores busy.
+PDF_EXECUTOR = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 4) * 2),
+                                  thread_name_prefix='pdf')
+
+# Dropbox token comes from the environment: a credential baked into
+# source leaks via version control and forces a code edit on rotation.
+DROPBOX_TOKEN = os.environ.get("DROPBOX_TOKEN", "")
 
 @dataclass
 class TaskData:
@@ -55,25 +84,149 @@ class DropboxUploader:
     def __init__(self):
         self.dbx = dropbox.Dropbox(DROPBOX_TOKEN)
         self.session = None
-        
+        self.batch = None
+
     async def setup_session(self):
         """Setup aiohttp session with connection pooling"""
+        # keepalive_timeout keeps idle connections to the Dropbox endpoints
+        # open between upload bursts, so each PDF reuses an established TLS
+        # connection instead of paying a fresh handshake (~1 RTT + crypto).
         connector = aiohttp.TCPConnector(
             limit=MAX_CONCURRENT_UPLOADS * 2,
             limit_per_host=MAX_CONCURRENT_UPLOADS,
             ttl_dns_cache=300,
             use_dns_cache=True,
+            keepalive_timeout=60,
         )
         self.session = aiohttp.ClientSession(
             connector=connector,
             timeout=aiohttp.ClientTimeout(total=300)
         )
-        
+        self.batch = DropboxBatchUploader(self)
+
     async def close_session(self):
         """Close aiohttp session"""
+        if self.batch:
+            await self.batch.flush()
         if self.session:
             await self.session.close()
 
+
+class DropboxBatchUploader:
+    """Commits many small uploads with one finish_batch call per group.
+
+    Each file still streams its bytes in an individual
+    /files/upload_session/start request (closed immediately), but the
+    expensive commit — the write operation Dropbox rate-limits — happens in
+    groups via /files/upload_session/finish_batch_v2, cutting write RPCs by
+    the batch size and avoiding too_many_write_operations contention.
+    Callers await a per-file future that resolves to the shared link once
+    the batch containing the file commits. A short debounce timer flushes
+    partial batches so stragglers can't wait forever.
+    """
+
+    def __init__(self, uploader: 'DropboxUploader', batch_size: int = 100, flush_interval: float = 1.0):
+        self.uploader = uploader
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []  # (finish_entry, future) tuples
+        self._lock = asyncio.Lock()
+        self._flush_timer = None
+
+    async def upload(self, path: str, data: bytes) -> str:
+        """Queue one file; returns its shared-link URL once committed."""
+        async with self.uploader.session.post(
+            "https://content.dropboxapi.com/2/files/upload_session/start",
+            headers={
+                "Authorization": f"Bearer {DROPBOX_TOKEN}",
+                "Dropbox-API-Arg": json.dumps({"close": True}),
+                "Content-Type": "application/octet-stream",
+            },
+            data=data
+        ) as resp:
+            resp.raise_for_status()
+            session_id = (await resp.json())["session_id"]
+
+        entry = {
+            "cursor": {"session_id": session_id, "offset": len(data)},
+            "commit": {"path": path, "mode": "overwrite"},
+        }
+        future = asyncio.get_event_loop().create_future()
+        async with self._lock:
+            self._pending.append((entry, future))
+            batch = None
+            if len(self._pending) >= self.batch_size:
+                batch, self._pending = self._pending, []
+            elif self._flush_timer is None or self._flush_timer.done():
+                self._flush_timer = asyncio.create_task(self._delayed_flush())
+        if batch:
+            await self._finish(batch)
+        return await future
+
+    async def flush(self):
+        """Commit whatever is queued, regardless of batch size."""
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            timer, self._flush_timer = self._flush_timer, None
+            # The debounce timer itself calls flush(); cancelling the task
+            # that is running this very flush would abort the commit and
+            # strand the batch's futures, so only cancel a *different* timer.
+            if timer and not timer.done() and timer is not asyncio.current_task():
+                timer.cancel()
+        if batch:
+            await self._finish(batch)
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def _finish(self, batch):
+        # Every future in the batch must be resolved no matter how this
+        # coroutine exits — including cancellation — or the callers awaiting
+        # them in upload() hang forever.
+        try:
+            async with self.uploader.session.post(
+                "https://api.dropboxapi.com/2/files/upload_session/finish_batch_v2",
+                headers={
+                    "Authorization": f"Bearer {DROPBOX_TOKEN}",
+                    "Content-Type": "application/json",
+                },
+                json={"entries": [entry for entry, _ in batch]}
+            ) as resp:
+                resp.raise_for_status()
+                results = (await resp.json())["entries"]
+
+            for (entry, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if result.get(".tag") == "success":
+                    try:
+                        future.set_result(await self._shared_link(entry["commit"]["path"]))
+                    except Exception as e:
+                        future.set_exception(e)
+                else:
+                    future.set_exception(
+                        RuntimeError(f"Batch commit failed for {entry['commit']['path']}: {result}")
+                    )
+        except BaseException as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise  # re-raise CancelledError and friends after failing the futures
+
+    async def _shared_link(self, path: str) -> str:
+        async with self.uploader.session.post(
+            "https://api.dropboxapi.com/2/sharing/create_shared_link",
+            headers={
+                "Authorization": f"Bearer {DROPBOX_TOKEN}",
+                "Content-Type": "application/json",
+            },
+            json={"path": path}
+        ) as resp:
+            resp.raise_for_status()
+            return (await resp.json())["url"]
+
     def verify_connection(self):
         """Verify Dropbox connection"""
         try:
@@ -117,32 +270,58 @@ def custom_css():
         }
     """
 
+# Compiled once at import: re.sub with a string pattern re-checks the regex
+# cache on every call, and the three quote replaces each rescanned and copied
+# the whole document. One combined pattern does the quote cleanup in a
+# single scan.
+_IMG_RE = re.compile(r'<img[^>]*src="https?://[^"]*"[^>]*>')
+_IMG_PLACEHOLDER = '<div style="border: 1px solid #ccc; padding: 20px; text-align: center; margin: 10px 0; background-color: #f9f9f9;">This response references a nonexistent visual element</div>'
+_QUOTE_RE = re.compile(r'""|\\"|\\\'')
+_QUOTE_MAP = {'""': '"', '\\"': '"', "\\'": "'"}
+
+# The document template never changes within a run, so the head (with the
+# standard CSS baked in) and tail are built once at import; make_pdf just
+# concatenates body content between them instead of re-rendering the
+# f-string template per call.
+_HTML_HEAD = f"""
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <style>
+         {custom_css()}
+        </style>
+    </head>
+    <body>
+        """
+_HTML_TAIL = """
+    </body>
+    </html>
+    """
+
 def make_pdf(content, css=None):
     """Convert HTML to PDF with consistent formatting"""
     if not content or pd.isna(content):
         return None
-    
+
     # Clean content
     content = str(content).replace("```html", "").replace("```", "")
-    content = content.replace('""', '"')
-    content = content.replace('\\"', '"')
-    content = content.replace("\\'", "'")
-    
+    content = _QUOTE_RE.sub(lambda m: _QUOTE_MAP[m.group()], content)
+
     # Handle images
-    content = re.sub(
-        r'<img[^>]*src="https?://[^"]*"[^>]*>',
-        '<div style="border: 1px solid #ccc; padding: 20px; text-align: center; margin: 10px 0; background-color: #f9f9f9;">This response references a nonexistent visual element</div>',
-        content
-    )
+    content = _IMG_RE.sub(_IMG_PLACEHOLDER, content)
 
-    # Create full HTML document
-    full_html = f"""
+    # Create full HTML document; css is only for non-standard overrides
+    if css is None:
+        full_html = _HTML_HEAD + content + _HTML_TAIL
+    else:
+        full_html = f"""
     <html>
     <head>
         <meta charset="UTF-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <style>
-         {css if css else ""}
+         {css}
         </style>
     </head>
     <body>
@@ -150,7 +329,7 @@ def make_pdf(content, css=None):
     </body>
     </html>
     """
-    
+
     try:
         options = {
             'enable-local-file-access': None,
@@ -171,18 +350,17 @@ def make_pdf(content, css=None):
         logger.error(f"Error generating PDF: {e}")
         raise
 
-async def upload_to_dropbox_async(filename: str, file_stream: BytesIO, dbx) -> str:
-    """Upload PDF to Dropbox with retry logic"""
+async def upload_to_dropbox_async(filename: str, file_stream: BytesIO, uploader: 'DropboxUploader') -> str:
+    """Upload PDF to Dropbox with retry logic.
+
+    Queues the file on the uploader's batch committer: bytes stream up in an
+    individual upload session, but the write commit happens in grouped
+    finish_batch calls, so per-file write RPCs collapse by the batch size.
+    """
+    upload_path = f"/Benchmark Storage ALL PDFS REORDERED 2-19/{filename}"
     for attempt in range(MAX_RETRIES):
         try:
-            upload_path = f"/Benchmark Storage ALL PDFS REORDERED 2-19/{filename}"
-            dbx.files_upload(
-                file_stream.getvalue(), 
-                upload_path, 
-                mode=dropbox.files.WriteMode.overwrite
-            )
-            shared_link = dbx.sharing_create_shared_link(upload_path)
-            return shared_link.url
+            return await uploader.batch.upload(upload_path, file_stream.getvalue())
         except Exception as e:
             if attempt == MAX_RETRIES - 1:
                 logger.error(f"Failed to upload {filename} after {MAX_RETRIES} attempts: {str(e)}")
@@ -195,85 +373,88 @@ async def upload_to_dropbox_async(filename: str, file_stream: BytesIO, dbx) -> s
 def precompute_ids(df: pd.DataFrame) -> List[TaskData]:
     """Pre-compute all occupation and task IDs"""
     logger.info("Pre-computing occupation and task IDs...")
-    
-    # Get unique occupations (jobs) and assign IDs
-    unique_jobs = df['Job'].unique()
-    job_to_occupation_id = {job: f"occupation_{i+1:03d}" for i, job in enumerate(unique_jobs)}
-    
-    # Create task data with pre-computed IDs
+
+    # Vectorized counters (all in first-appearance order, matching the old
+    # per-row dict bookkeeping):
+    #  - occupation number: ngroup over Job
+    #  - task number within job: cumcount over the distinct (Job, Task) pairs
+    #  - row number within (Job, Task): cumcount over the pair groups
+    occupation_nums = df.groupby('Job', sort=False).ngroup() + 1
+    pairs = df[['Job', 'Task']].drop_duplicates()
+    pair_task_numbers = pairs.assign(_task_number=pairs.groupby('Job', sort=False).cumcount() + 1)
+    task_numbers = df.merge(pair_task_numbers, on=['Job', 'Task'], how='left', sort=False)['_task_number'].values
+    row_numbers = df.groupby(['Job', 'Task'], sort=False).cumcount() + 1
+
+    # Build the ID strings in vectorized string ops: task_XXX_YY_Z
+    occ_str = occupation_nums.astype(str).str.zfill(3)
+    occupation_ids = "occupation_" + occ_str
+    task_ids = (
+        "task_" + occ_str
+        + "_" + pd.Series(task_numbers, index=df.index).astype(int).astype(str).str.zfill(2)
+        + "_" + row_numbers.astype(str)
+    )
+
+    # Create task data from the pre-computed columns. itertuples avoids the
+    # per-row Series construction iterrows pays; the index is zipped in
+    # separately so original_index keeps its meaning.
     task_data_list = []
-    job_task_counters = {}  # Track task numbers within each job
-    job_task_row_counters = {}  # Track row numbers within each job/task pair
-    
-    for idx, row in df.iterrows():
-        job = row['Job']
-        task = row['Task']
-        occupation_id = job_to_occupation_id[job]
-        
-        # Get or initialize task number for this job/task combination
-        job_task_key = (job, task)
-        if job_task_key not in job_task_counters:
-            job_task_counters[job_task_key] = len([k for k in job_task_counters.keys() if k[0] == job]) + 1
-            job_task_row_counters[job_task_key] = 0
-        
-        # Increment row counter for this job/task pair
-        job_task_row_counters[job_task_key] += 1
-        task_number = job_task_counters[job_task_key]
-        row_number = job_task_row_counters[job_task_key]
-        
-        # Create task_id in format: task_XXX_YY_Z
-        occupation_num = int(occupation_id.split('_')[1])
-        task_id = f"task_{occupation_num:03d}_{task_number:02d}_{row_number}"
-        
+    for idx, row in zip(df.index, df.itertuples(index=False)):
         # Prepare columns to process
         columns_to_process = {}
         for col in ['Question', 'model1', 'model2', 'model3', 'model4', 'model5']:
-            if col in row and not pd.isna(row[col]):
-                columns_to_process[col] = row[col]
-        
+            value = getattr(row, col, None)
+            if value is not None and not pd.isna(value):
+                columns_to_process[col] = value
+
         task_data = TaskData(
             original_index=idx,
-            occupation_id=occupation_id,
-            task_id=task_id,
-            job=job,
-            task=task,
-            order_models=row.get('order_models', ''),
+            occupation_id=occupation_ids.at[idx],
+            task_id=task_ids.at[idx],
+            job=row.Job,
+            task=row.Task,
+            order_models=getattr(row, 'order_models', ''),
             columns_to_process=columns_to_process
         )
         task_data_list.append(task_data)
-    
+
     logger.info(f"Pre-computed IDs for {len(task_data_list)} tasks")
-    logger.info(f"Found {len(unique_jobs)} unique occupations")
-    
+    logger.info(f"Found {df['Job'].nunique()} unique occupations")
+
     return task_data_list
 
+# Content-hash -> shared-link URL. Identical HTML (repeated questions,
+# boilerplate responses) renders and uploads once; later occurrences reuse
+# the first URL. blake2b-128 keys keep the dict small.
+PDF_URL_CACHE: Dict[bytes, str] = {}
+_PDF_CACHE_LOCK = asyncio.Lock()
+
 async def process_single_column(task_data: TaskData, column_name: str, content: str, uploader: DropboxUploader) -> Tuple[int, str, str]:
     """Process a single column (convert to PDF and upload)"""
     try:
-        # Generate PDF in thread pool to avoid blocking
+        # Reuse the URL of an already-processed identical document
+        cache_key = hashlib.blake2b(str(content).encode(), digest_size=16).digest()
+        async with _PDF_CACHE_LOCK:
+            cached_url = PDF_URL_CACHE.get(cache_key)
+        if cached_url is not None:
+            return task_data.original_index, column_name, cached_url
+
+        # Generate PDF in the shared thread pool to avoid blocking
         loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            pdf_buffer = await loop.run_in_executor(
-                executor, 
-                make_pdf, 
-                content, 
-                custom_css()
-            )
-        
+        pdf_buffer = await loop.run_in_executor(
+            PDF_EXECUTOR,
+            make_pdf,
+            content
+        )
+
         if pdf_buffer:
-            # Create filename based on column type
-            if column_name == 'Question':
-                # For Question column: just task_id.pdf
-                filename = f"{task_data.task_id}.pdf"
-            elif column_name.startswith('model'):
-                # For model columns: task_id_model=ModelName.pdf
-                model_name = MODEL_NAMES.get(column_name, column_name)
-                filename = f"{task_data.task_id}_model={model_name}.pdf"
-            else:
-                # Fallback for any other columns
-                filename = f"{task_data.task_id}_{column_name}.pdf"
-            
-            url = await upload_to_dropbox_async(filename, pdf_buffer, uploader.dbx)
+            # Filename from the precomputed per-column template; unknown
+            # columns fall back to task_id_column.pdf
+            fmt = FILENAME_FMT.get(column_name, f'{{tid}}_{column_name}.pdf')
+            filename = fmt.format(tid=task_data.task_id)
+
+            url = await upload_to_dropbox_async(filename, pdf_buffer, uploader)
+            async with _PDF_CACHE_LOCK:
+                PDF_URL_CACHE[cache_key] = url
             return task_data.original_index, column_name, url
         else:
             return task_data.original_index, column_name, None
@@ -282,193 +463,149 @@ async def process_single_column(task_data: TaskData, column_name: str, content:
         logger.error(f"Error processing {task_data.task_id}_{column_name}: {str(e)}")
         return task_data.original_index, column_name, None
 
-async def process_task_batch(task_batch: List[TaskData], uploader: DropboxUploader, semaphore: asyncio.Semaphore) -> List[Tuple[int, Dict[str, Any]]]:
-    """Process a batch of tasks with concurrency control"""
-    async def process_task_with_semaphore(task_data: TaskData):
-        async with semaphore:
-            # Process all columns for this task
-            tasks = []
-            for column_name, content in task_data.columns_to_process.items():
-                task_coro = process_single_column(task_data, column_name, content, uploader)
-                tasks.append(task_coro)
-            
-            # Wait for all columns to complete
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Build result dictionary
-            task_result = {
-                'occupation_id': task_data.occupation_id,
-                'task_id': task_data.task_id,
-                'Job': task_data.job,
-                'Task': task_data.task,
-                'order_models': task_data.order_models,
-            }
-            
-            # Add column results
-            for result in results:
-                if isinstance(result, tuple) and len(result) == 3:
-                    _, column_name, url = result
-                    task_result[column_name] = url
-                elif isinstance(result, Exception):
-                    logger.error(f"Exception in column processing: {result}")
-            
-            return task_data.original_index, task_result
-    
-    # Process all tasks in the batch
-    batch_tasks = [process_task_with_semaphore(task_data) for task_data in task_batch]
-    batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
-    
-    # Filter out exceptions and return valid results
-    valid_results = []
-    for result in batch_results:
-        if isinstance(result, tuple) and len(result) == 2:
-            valid_results.append(result)
-        elif isinstance(result, Exception):
-            logger.error(f"Exception in task processing: {result}")
-    
-    return valid_results
+async def process_task(task_data: TaskData, uploader: DropboxUploader) -> Tuple[int, Dict[str, Any]]:
+    """Process all columns of a single task. Concurrency across tasks is
+    bounded by the worker pool in main, so no semaphore is needed here."""
+    # Process all columns for this task
+    tasks = [
+        process_single_column(task_data, column_name, content, uploader)
+        for column_name, content in task_data.columns_to_process.items()
+    ]
+
+    # Build result dictionary
+    task_result = {
+        'occupation_id': task_data.occupation_id,
+        'task_id': task_data.task_id,
+        'Job': task_data.job,
+        'Task': task_data.task,
+        'order_models': task_data.order_models,
+    }
+
+    # Collect column results as they finish; exceptions are handled
+    # inline rather than gathered into a list and type-checked after.
+    for future in asyncio.as_completed(tasks):
+        try:
+            _, column_name, url = await future
+            task_result[column_name] = url
+        except Exception as e:
+            logger.error(f"Exception in column processing: {e}")
 
-def generate_latin_square_orders(n_models: int, n_rows: int) -> List[List[str]]:
+    return task_data.original_index, task_result
+
+def generate_latin_square_orders(n_models: int, n_rows: int) -> np.ndarray:
     """
     Generate Latin Square randomized orders for models.
     Ensures each model appears in each position equally often.
+
+    Returns an (n_rows, 5) int8 permutation matrix mapping each row's
+    positions to source-model indices — one np.tile of the shuffled 5x5
+    base square, with no per-row Python lists — ready for the vectorized
+    gather in apply_model_randomization.
     """
-    model_names = list(MODEL_NAMES.values())  # ['GPT_4o_2025', 'Claude_3_Opus', etc.]
-    
     if n_models != 5:
         raise ValueError("This implementation is designed for exactly 5 models")
-    
-    # Generate all possible Latin Square rows for 5 models
+
     # A 5x5 Latin Square where each model appears once in each row and column
-    base_squares = [
+    base_square = np.array([
         [0, 1, 2, 3, 4],
         [1, 2, 3, 4, 0],
         [2, 3, 4, 0, 1],
         [3, 4, 0, 1, 2],
         [4, 0, 1, 2, 3]
-    ]
-    
-    # Convert to model names
-    latin_square_orders = []
-    for square_row in base_squares:
-        order = [model_names[i] for i in square_row]
-        latin_square_orders.append(order)
-    
-    # Shuffle the base square orders to add randomness while maintaining balance
-    random.shuffle(latin_square_orders)
-    
+    ], dtype=np.int8)
+
+    # Shuffle the base square rows to add randomness while maintaining balance
+    rng = np.random.default_rng()
+    rng.shuffle(base_square, axis=0)
+
     # Repeat the pattern to cover all rows
-    result_orders = []
-    for i in range(n_rows):
-        square_index = i % len(latin_square_orders)
-        result_orders.append(latin_square_orders[square_index].copy())
-    
+    reps = (n_rows + n_models - 1) // n_models
+    perm_idx = np.tile(base_square, (reps, 1))[:n_rows]
+
     logger.info(f"Generated {n_rows} Latin Square randomized orders")
     logger.info(f"Each model will appear in each position approximately {n_rows/n_models:.1f} times")
-    
-    return result_orders
+
+    return perm_idx
 
 def apply_model_randomization(df: pd.DataFrame) -> pd.DataFrame:
     """
     Apply Latin Square randomization to model columns and save order.
     """
     logger.info("Applying Latin Square randomization to model columns...")
-    
-    # Create a copy of the dataframe
-    randomized_df = df.copy()
-    
+
     # Get the model columns (should be URLs now)
     model_columns = ['model1', 'model2', 'model3', 'model4', 'model5']
     original_model_names = list(MODEL_NAMES.values())
-    
-    # Generate Latin Square orders
+
+    # Generate Latin Square orders as an (N, 5) permutation matrix mapping
+    # destination position -> source model; one np.take_along_axis call
+    # gathers the URL matrix.
     n_rows = len(df)
-    latin_orders = generate_latin_square_orders(5, n_rows)
-    
-    # Apply randomization to each row
-    randomized_model_data = []
-    order_strings = []
-    
-    for idx, (_, row) in enumerate(df.iterrows()):
-        current_order = latin_orders[idx]
-        
-        # Create mapping from current model names to their URLs
-        model_url_mapping = {}
-        for i, model_col in enumerate(model_columns):
-            original_model_name = original_model_names[i]
-            model_url_mapping[original_model_name] = row[model_col]
-        
-        # Create new row with randomized order
-        randomized_row_data = {}
-        for i, model_name in enumerate(current_order):
-            new_col = model_columns[i]  # model1, model2, etc.
-            randomized_row_data[new_col] = model_url_mapping[model_name]
-        
-        randomized_model_data.append(randomized_row_data)
-        
-        # Create order string (concatenated list)
-        order_string = ','.join(current_order)
-        order_strings.append(order_string)
-    
-    # Update the dataframe with randomized model columns
-    for i, model_col in enumerate(model_columns):
-        randomized_df[model_col] = [row[model_col] for row in randomized_model_data]
-    
-    # Add the order_models column
-    randomized_df['order_models'] = order_strings
+    perm_idx = generate_latin_square_orders(5, n_rows)
+
+    urls = df[model_columns].to_numpy()
+    permuted = np.take_along_axis(urls, perm_idx, axis=1)
+
+    # Build the output without copying the untouched columns: only the five
+    # model columns and order_models change, so everything else (including the
+    # long Question/Task strings) is carried over as-is and just the new
+    # 6-column block is materialized.
+    new_cols = pd.DataFrame(permuted, columns=model_columns, index=df.index)
+
+    # Add the order_models column (concatenated model-name lists), built from
+    # the same permutation matrix rather than the list-of-lists orders
+    name_grid = np.array(original_model_names)[perm_idx]
+    new_cols['order_models'] = [','.join(row) for row in name_grid]
+
+    non_model = df.drop(columns=model_columns + ['order_models'], errors='ignore')
+    randomized_df = pd.concat([non_model, new_cols], axis=1, copy=False)
+    # Restore the input column order (concat appended the new block at the end)
+    randomized_df = randomized_df[[c for c in df.columns if c in randomized_df.columns]]
     
     # Verify balance
-    verify_latin_square_balance(order_strings, original_model_names)
+    verify_latin_square_balance(perm_idx, original_model_names)
     
     return randomized_df
 
-def verify_latin_square_balance(order_strings: List[str], model_names: List[str]):
+def verify_latin_square_balance(perm_idx: np.ndarray, model_names: List[str]):
     """
     Verify that the Latin Square randomization is properly balanced.
+
+    Takes the (N, 5) integer permutation matrix from
+    apply_model_randomization; counts come from one bincount per position
+    instead of splitting and tallying N order strings in Python.
     """
     logger.info("Verifying Latin Square balance...")
-    
-    # Count how many times each model appears in each position
-    position_counts = {model: [0] * 5 for model in model_names}
-    
-    for order_string in order_strings:
-        models_in_order = order_string.split(',')
-        for position, model in enumerate(models_in_order):
-            if model in position_counts:
-                position_counts[model][position] += 1
-    
+
+    # counts[model, position]: how often each model appears in each position
+    counts = np.stack(
+        [np.bincount(perm_idx[:, pos], minlength=len(model_names)) for pos in range(perm_idx.shape[1])],
+        axis=1
+    )
+
     # Print balance verification
     logger.info("Model position distribution:")
-    for model in model_names:
-        counts = position_counts[model]
-        logger.info(f"  {model}: {counts} (total: {sum(counts)})")
-    
+    for i, model in enumerate(model_names):
+        logger.info(f"  {model}: {counts[i].tolist()} (total: {int(counts[i].sum())})")
+
     # Check if reasonably balanced
-    total_rows = len(order_strings)
+    total_rows = len(perm_idx)
     expected_per_position = total_rows / 5
     tolerance = 1  # Allow ±1 difference
-    
-    balanced = True
-    for model in model_names:
-        for pos_count in position_counts[model]:
-            if abs(pos_count - expected_per_position) > tolerance:
-                balanced = False
-                break
-    
+
+    balanced = bool(np.all(np.abs(counts - expected_per_position) <= tolerance))
+
     if balanced:
         logger.info("✓ Latin Square randomization is properly balanced")
     else:
         logger.warning("⚠ Latin Square randomization may not be perfectly balanced (acceptable for non-multiple-of-5 sample sizes)")
 
-async def save_randomized_output(results_list: List[Dict[str, Any]]):
+async def save_randomized_output(results_df: pd.DataFrame):
     """Save the final output with Latin Square randomized model order"""
-    if not results_list:
+    if results_df is None or results_df.empty:
         return
-        
+
     try:
-        # Convert to DataFrame
-        results_df = pd.DataFrame(results_list)
-        
         # Apply Latin Square randomization
         randomized_df = apply_model_randomization(results_df)
         
@@ -480,9 +617,12 @@ async def save_randomized_output(results_list: List[Dict[str, Any]]):
         existing_columns = [col for col in column_order if col in randomized_df.columns]
         randomized_df = randomized_df[existing_columns]
         
-        # Save randomized version
+        # Save randomized version with xlsxwriter (faster than openpyxl for
+        # write-only workbooks). Note: constant_memory mode is NOT safe here —
+        # pandas emits cells column by column, and constant-memory mode drops
+        # writes to rows it has already flushed, silently losing data.
         randomized_output_file = os.path.join(SAVE_DIRECTORY, 'task_urls_HTML_benchmark_PDF_randomized_v3.xlsx')
-        randomized_df.to_excel(randomized_output_file, index=False)
+        randomized_df.to_excel(randomized_output_file, index=False, engine='xlsxwriter')
         
         logger.info(f"Saved randomized output: {len(randomized_df)} rows to {randomized_output_file}")
         
@@ -510,6 +650,10 @@ async def main():
     # Ensure output directory exists
     os.makedirs(SAVE_DIRECTORY, exist_ok=True)
     
+    if not DROPBOX_TOKEN:
+        logger.error("DROPBOX_TOKEN environment variable is not set")
+        return
+
     # Initialize uploader and verify connection
     uploader = DropboxUploader()
     if not uploader.verify_connection():
@@ -521,54 +665,72 @@ async def main():
     try:
         # Load Excel file
         logger.info(f"Loading Excel file: {EXCEL_FILE}")
-        df = pd.read_excel(EXCEL_FILE, sheet_name=SHEET_NAME, engine='openpyxl')
+        df = pd.read_excel(EXCEL_FILE, sheet_name=SHEET_NAME, engine='openpyxl',
+                           usecols=lambda c: c in LOAD_COLUMNS, dtype=str)
         logger.info(f"Loaded {len(df)} rows")
         
         # Pre-compute all IDs
         task_data_list = precompute_ids(df)
         
-        # Initialize results array to maintain order
+        # Columnar results store: one preallocated list per output column.
+        # Wrapping this dict in pd.DataFrame at the end reuses the lists as
+        # columns directly, instead of inferring the schema from N row dicts.
         total_tasks = len(task_data_list)
-        results_array = [None] * total_tasks
-        
-        # Create semaphore for concurrency control
-        semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
-        
-        # Process in batches
-        batch_size = 50  # Smaller batches for better memory management
-        logger.info(f"Processing {total_tasks} tasks in batches of {batch_size}")
-        
+        results_columns = {col: [None] * total_tasks for col in RESULT_COLUMNS}
+
+        # Start this run's progress log fresh
+        progress_file = os.path.join(SAVE_DIRECTORY, PROGRESS_FILENAME)
+        if os.path.exists(progress_file):
+            os.remove(progress_file)
+
+        # Fixed pool of workers fed from a bounded queue. Unlike the old
+        # batch-of-50 loop, no worker ever idles waiting for the slowest
+        # task of a batch — each one pulls the next task as soon as it
+        # finishes its current one.
+        queue: asyncio.Queue = asyncio.Queue(maxsize=2 * MAX_CONCURRENT_UPLOADS)
         processed_count = 0
-        for start_idx in range(0, total_tasks, batch_size):
-            end_idx = min(start_idx + batch_size, total_tasks)
-            batch = task_data_list[start_idx:end_idx]
-            
-            batch_start_time = time.time()
-            logger.info(f"Processing batch {start_idx//batch_size + 1}/{(total_tasks-1)//batch_size + 1}")
-            
-            # Process batch
-            batch_results = await process_task_batch(batch, uploader, semaphore)
-            
-            # Store results in order
-            for original_index, task_result in batch_results:
-                results_array[original_index] = task_result
-                processed_count += 1
-            
-            batch_duration = time.time() - batch_start_time
-            logger.info(f"Batch completed in {batch_duration:.2f} seconds. Processed: {processed_count}/{total_tasks}")
-            
-            # Save progress periodically
-            if processed_count % SAVE_INTERVAL == 0:
-                await save_progress(results_array[:processed_count])
-        
-        # Final save with all results (original order)
+        pending_progress = []
+
+        async def worker():
+            nonlocal processed_count
+            while True:
+                task_data = await queue.get()
+                try:
+                    original_index, task_result = await process_task(task_data, uploader)
+                    for key, value in task_result.items():
+                        results_columns[key][original_index] = value
+                    processed_count += 1
+                    pending_progress.append(task_result)
+                    if len(pending_progress) >= SAVE_INTERVAL:
+                        rows, pending_progress[:] = pending_progress[:], []
+                        await save_progress(rows)
+                        logger.info(f"Processed: {processed_count}/{total_tasks}")
+                except Exception as e:
+                    logger.error(f"Exception in task processing: {e}")
+                finally:
+                    queue.task_done()
+
+        logger.info(f"Processing {total_tasks} tasks with {MAX_CONCURRENT_UPLOADS} workers")
+        workers = [asyncio.create_task(worker()) for _ in range(MAX_CONCURRENT_UPLOADS)]
+        for task_data in task_data_list:
+            await queue.put(task_data)
+        await queue.join()
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+        # Flush any progress rows below the save threshold
+        await save_progress(pending_progress)
+
+        # Final save with all results (original order, unprocessed rows dropped)
         logger.info("Saving final results...")
-        final_results = [r for r in results_array if r is not None]
-        await save_progress(final_results)
-        
+        final_df = pd.DataFrame(results_columns)
+        final_df = final_df[final_df['task_id'].notna()].reset_index(drop=True)
+        await save_final_output(final_df)
+
         # Generate and save randomized version with Latin Square
         logger.info("Generating Latin Square randomized version...")
-        randomized_df = await save_randomized_output(final_results)
+        randomized_df = await save_randomized_output(final_df)
         
         if randomized_df is not None:
             logger.info("✓ Successfully generated both original and randomized outputs")
@@ -580,31 +742,51 @@ async def main():
     logger.info(f"Processing completed in {total_duration:.2f} seconds")
     logger.info(f"Total tasks processed: {processed_count}")
 
-async def save_progress(results_list: List[Dict[str, Any]]):
-    """Save progress to Excel file"""
-    if not results_list:
+async def save_progress(new_results: List[Dict[str, Any]]):
+    """Append newly completed rows to the JSONL progress file.
+
+    Appending is O(batch) per call; rewriting the whole workbook every
+    SAVE_INTERVAL rows made total save cost quadratic in run length. The
+    final Excel file is written once by save_final_output.
+    """
+    if not new_results:
+        return
+
+    try:
+        progress_file = os.path.join(SAVE_DIRECTORY, PROGRESS_FILENAME)
+        with open(progress_file, 'a') as f:
+            for row in new_results:
+                json.dump(row, f)
+                f.write('\n')
+
+        logger.info(f"Appended {len(new_results)} rows to {progress_file}")
+
+    except Exception as e:
+        logger.error(f"Error saving progress: {str(e)}")
+
+async def save_final_output(results_df: pd.DataFrame):
+    """Write the complete results to the Excel output file (once, at the end)"""
+    if results_df is None or results_df.empty:
         return
-        
+
     try:
-        # Convert to DataFrame
-        results_df = pd.DataFrame(results_list)
-        
         # Reorder columns
-        column_order = ['occupation_id', 'task_id', 'Job', 'Task', 'order_models', 
+        column_order = ['occupation_id', 'task_id', 'Job', 'Task', 'order_models',
                        'Question', 'model1', 'model2', 'model3', 'model4', 'model5']
-        
+
         # Only include columns that exist in the DataFrame
         existing_columns = [col for col in column_order if col in results_df.columns]
         results_df = results_df[existing_columns]
-        
-        # Save to Excel
+
+        # Save to Excel (xlsxwriter; see the constant-memory note in
+        # save_randomized_output for why streaming mode is not used)
         output_file = os.path.join(SAVE_DIRECTORY, 'task_urls_HTML_benchmark_PDF_optimized_v3.xlsx')
-        results_df.to_excel(output_file, index=False)
-        
-        logger.info(f"Saved progress: {len(results_df)} rows to {output_file}")
-        
+        results_df.to_excel(output_file, index=False, engine='xlsxwriter')
+
+        logger.info(f"Saved final results: {len(results_df)} rows to {output_file}")
+
     except Exception as e:
-        logger.error(f"Error saving progress: {str(e)}")
+        logger.error(f"Error saving final results: {str(e)}")
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file